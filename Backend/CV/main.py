@@ -4,6 +4,8 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import hashlib
 import random
 from dataclasses import dataclass
 from pathlib import Path
@@ -15,7 +17,10 @@ import torch
 from PIL import Image
 from torch import nn, optim
 from torch.utils.data import DataLoader, Dataset
-from torchvision import models, transforms
+from torchvision import models
+from torchvision.io import ImageReadMode, decode_jpeg
+from torchvision.transforms import v2
+from torchvision.transforms.functional import pil_to_tensor
 
 import os
 
@@ -33,22 +38,50 @@ class TrainConfig:
     train_split: float
     seed: int
     num_workers: int
+    cache_images: bool
 
 
 class SlotDataset(Dataset):
-    def __init__(self, df: pd.DataFrame, root: Path, transform: transforms.Compose):
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        root: Path,
+        transform: v2.Compose,
+        decode_device: Optional[torch.device] = None,
+        cache: Optional[np.ndarray] = None,
+    ):
         self.df = df.reset_index(drop=True)
-        self.root = root
+        # Plain ndarrays: per-item access skips the pandas .iloc Series
+        # allocation on every __getitem__ call.
+        self.paths = self.df["image_path"].to_numpy()
+        self.labels = self.df["label_id"].to_numpy()
+        # Join paths once up front: Path.__truediv__ per __getitem__ call
+        # allocates fresh PurePath objects in the loader hot loop.
+        root_str = os.fspath(root)
+        self.path_strs = [os.path.join(root_str, rel) for rel in self.paths]
         self.transform = transform
+        self.decode_device = decode_device or torch.device("cpu")
+        self.cache = cache
 
     def __len__(self) -> int:  # type: ignore[override]
         return len(self.df)
 
     def __getitem__(self, idx: int) -> Tuple[torch.Tensor, int]:  # type: ignore[override]
-        row = self.df.iloc[idx]
-        path = self.root / row["image_path"]
-        image = Image.open(path).convert("RGB")
-        return self.transform(image), int(row["label_id"])
+        label = int(self.labels[idx])
+        if self.cache is not None:
+            image = torch.from_numpy(np.ascontiguousarray(self.cache[idx]))
+            return self.transform(image), label
+        path = self.path_strs[idx]
+        if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+            # torchvision.io decodes via libjpeg-turbo (or nvJPEG straight
+            # into device memory when decode_device is CUDA) — faster than
+            # the PIL open/convert path, which is kept for other formats.
+            with open(path, "rb") as handle:
+                data = torch.frombuffer(handle.read(), dtype=torch.uint8)
+            image = decode_jpeg(data, mode=ImageReadMode.RGB, device=self.decode_device)
+        else:
+            image = pil_to_tensor(Image.open(path).convert("RGB"))
+        return self.transform(image), label
 
 
 def parse_args(argv: Optional[Sequence[str]] = None) -> TrainConfig:
@@ -61,7 +94,17 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> TrainConfig:
     parser.add_argument("--weight-decay", type=float, default=1e-4)
     parser.add_argument("--train-split", type=float, default=0.8)
     parser.add_argument("--seed", type=int, default=42)
-    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Loader workers; defaults to min(8, cores-1). Pass 0 for the main process.",
+    )
+    parser.add_argument(
+        "--cache-images",
+        action="store_true",
+        help="Pre-decode all crops once into an mmapped uint8 cache so epochs skip JPEG decode",
+    )
     args = parser.parse_args(argv)
     return TrainConfig(
         dataset_dir=args.dataset_dir,
@@ -72,7 +115,12 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> TrainConfig:
         weight_decay=args.weight_decay,
         train_split=args.train_split,
         seed=args.seed,
-        num_workers=args.num_workers,
+        num_workers=(
+            args.num_workers
+            if args.num_workers is not None
+            else max(0, min(8, (os.cpu_count() or 1) - 1))
+        ),
+        cache_images=args.cache_images,
     )
 
 
@@ -101,9 +149,19 @@ def load_metadata(cfg: TrainConfig) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
             f"metadata.csv not found in {cfg.dataset_dir}. Run extract_slots_xml.py or extract_slots_json.py first to create slot samples."
         )
 
-    df = pd.read_csv(metadata_path)
-    if "label_id" not in df.columns:
-        raise ValueError("metadata.csv must contain a 'label_id' column")
+    # Only two columns are consumed; selecting them with explicit dtypes
+    # skips type inference over the rest of the file.
+    try:
+        df = pd.read_csv(
+            metadata_path,
+            usecols=["image_path", "label_id"],
+            dtype={"image_path": "string", "label_id": "int64"},
+            engine="c",
+        )
+    except ValueError as exc:
+        raise ValueError(
+            "metadata.csv must contain 'image_path' and 'label_id' columns"
+        ) from exc
 
     df = df.sample(frac=1.0, random_state=cfg.seed).reset_index(drop=True)
     train_len = int(len(df) * cfg.train_split)
@@ -117,24 +175,61 @@ def load_metadata(cfg: TrainConfig) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
     return train_df, val_df, num_classes
 
 
-def build_transforms() -> Tuple[transforms.Compose, transforms.Compose]:
-    normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    resize = transforms.Resize((224, 224))
-
-    train_tf = transforms.Compose(
+def decode_crop(path: Path) -> torch.Tensor:
+    if path.suffix.lower() in (".jpg", ".jpeg"):
+        data = torch.frombuffer(path.read_bytes(), dtype=torch.uint8)
+        return decode_jpeg(data, mode=ImageReadMode.RGB)
+    return pil_to_tensor(Image.open(path).convert("RGB"))
+
+
+def prepare_cache(cfg: TrainConfig, df: pd.DataFrame, split: str) -> np.ndarray:
+    """Pre-decode one split into an mmapped uint8 (N,3,224,224) tensor.
+
+    The cache is keyed on metadata.csv content plus the seed/split
+    parameters, so a changed dataset or shuffle invalidates it; epochs
+    then read raw pixels from the mmap instead of re-decoding JPEGs.
+    """
+    cache_path = cfg.dataset_dir / f"slot_cache_{split}.u8"
+    key_path = cache_path.with_suffix(".key")
+    digest = hashlib.md5((cfg.dataset_dir / "metadata.csv").read_bytes())
+    digest.update(f"{cfg.seed}:{cfg.train_split}:{split}".encode())
+    key = digest.hexdigest()
+    shape = (len(df), 3, 224, 224)
+
+    if cache_path.exists() and key_path.exists() and key_path.read_text() == key:
+        return np.memmap(cache_path, dtype=np.uint8, mode="r", shape=shape)
+
+    print(f"Building image cache for {split} split ({len(df)} crops)...")
+    resize = v2.Resize((224, 224), antialias=True)
+    mmap = np.memmap(cache_path, dtype=np.uint8, mode="w+", shape=shape)
+    for i, rel_path in enumerate(df["image_path"].to_numpy()):
+        mmap[i] = resize(decode_crop(cfg.dataset_dir / rel_path)).numpy()
+    mmap.flush()
+    key_path.write_text(key)
+    return np.memmap(cache_path, dtype=np.uint8, mode="r", shape=shape)
+
+
+def build_transforms() -> Tuple[v2.Compose, v2.Compose]:
+    normalize = v2.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    resize = v2.Resize((224, 224), antialias=True)
+
+    # transforms.v2 runs geometry and color jitter on uint8 tensors and
+    # folds the /255 scale into ToDtype, so float conversion + normalize
+    # touch the pixels once instead of twice.
+    train_tf = v2.Compose(
         [
             resize,
-            transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.05),
-            transforms.RandomHorizontalFlip(),
-            transforms.ToTensor(),
+            v2.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.05),
+            v2.RandomHorizontalFlip(),
+            v2.ToDtype(torch.float32, scale=True),
             normalize,
         ]
     )
 
-    val_tf = transforms.Compose(
+    val_tf = v2.Compose(
         [
             resize,
-            transforms.ToTensor(),
+            v2.ToDtype(torch.float32, scale=True),
             normalize,
         ]
     )
@@ -146,22 +241,37 @@ def build_model(num_classes: int) -> nn.Module:
     model = models.mobilenet_v3_small(weights=weights)
     in_features = model.classifier[-1].in_features
     model.classifier[-1] = nn.Linear(in_features, num_classes)
-    return model
+    # NHWC lets conv kernels on CUDA/MPS skip layout transposes.
+    return model.to(memory_format=torch.channels_last)
 
 
-def train_one_epoch(model: nn.Module, loader: DataLoader, criterion: nn.Module, optimizer: optim.Optimizer, device: torch.device) -> Tuple[float, float]:
+def amp_autocast(device: torch.device):
+    # fp16 on CUDA (tensor cores + GradScaler); bf16 on CPU, which keeps
+    # fp32 range and needs no loss scaling. MPS stays eager — autocast
+    # only accepts device_type="mps" from torch 2.5, past our declared
+    # floor (same exclusion as torch.compile above).
+    if device.type == "mps":
+        return contextlib.nullcontext()
+    dtype = torch.float16 if device.type == "cuda" else torch.bfloat16
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+
+def train_one_epoch(model: nn.Module, loader: DataLoader, criterion: nn.Module, optimizer: optim.Optimizer, scaler: torch.cuda.amp.GradScaler, device: torch.device) -> Tuple[float, float]:
     model.train()
     running_loss = 0.0
     correct = 0
     total = 0
 
     for images, labels in loader:
-        images, labels = images.to(device), labels.to(device)
+        images = images.to(device, memory_format=torch.channels_last, non_blocking=True)
+        labels = labels.to(device, non_blocking=True)
         optimizer.zero_grad()
-        logits = model(images)
-        loss = criterion(logits, labels)
-        loss.backward()
-        optimizer.step()
+        with amp_autocast(device):
+            logits = model(images)
+            loss = criterion(logits, labels)
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
 
         running_loss += loss.item() * labels.size(0)
         preds = torch.argmax(logits, dim=1)
@@ -179,9 +289,11 @@ def evaluate(model: nn.Module, loader: DataLoader, criterion: nn.Module, device:
 
     with torch.no_grad():
         for images, labels in loader:
-            images, labels = images.to(device), labels.to(device)
-            logits = model(images)
-            loss = criterion(logits, labels)
+            images = images.to(device, memory_format=torch.channels_last, non_blocking=True)
+            labels = labels.to(device, non_blocking=True)
+            with amp_autocast(device):
+                logits = model(images)
+                loss = criterion(logits, labels)
             running_loss += loss.item() * labels.size(0)
             preds = torch.argmax(logits, dim=1)
             correct += (preds == labels).sum().item()
@@ -199,16 +311,52 @@ def main(cfg: Optional[TrainConfig] = None) -> None:
     train_df, val_df, num_classes = load_metadata(cfg)
     train_tf, val_tf = build_transforms()
 
-    train_dataset = SlotDataset(train_df, cfg.dataset_dir, train_tf)
-    val_dataset = SlotDataset(val_df, cfg.dataset_dir, val_tf)
-
-    train_loader = DataLoader(train_dataset, batch_size=cfg.batch_size, shuffle=True, num_workers=cfg.num_workers, pin_memory=True)
-    val_loader = DataLoader(val_dataset, batch_size=cfg.batch_size, shuffle=False, num_workers=cfg.num_workers, pin_memory=True)
-
     device = resolve_device()
+    # CUDA decode only works outside worker processes.
+    decode_device = device if device.type == "cuda" and cfg.num_workers == 0 else None
+    train_cache = val_cache = None
+    if cfg.cache_images:
+        train_cache = prepare_cache(cfg, train_df, "train")
+        val_cache = prepare_cache(cfg, val_df, "val")
+        # Cached crops are already 224x224; drop the leading Resize.
+        train_tf = v2.Compose(train_tf.transforms[1:])
+        val_tf = v2.Compose(val_tf.transforms[1:])
+    train_dataset = SlotDataset(train_df, cfg.dataset_dir, train_tf, decode_device, train_cache)
+    val_dataset = SlotDataset(val_df, cfg.dataset_dir, val_tf, decode_device, val_cache)
+
+    # pin_memory only helps the CUDA H2D path; on MPS/CPU it just copies,
+    # and with CUDA-side decode the batches are already device tensors
+    # (pinning a CUDA tensor raises).
+    loader_kwargs = dict(
+        batch_size=cfg.batch_size,
+        num_workers=cfg.num_workers,
+        pin_memory=device.type == "cuda" and decode_device is None,
+    )
+    if cfg.num_workers > 0:
+        # Keep workers alive across epochs and queue more batches ahead so
+        # short epochs don't pay fork + torchvision import every time.
+        loader_kwargs.update(persistent_workers=True, prefetch_factor=4)
+    train_loader = DataLoader(train_dataset, shuffle=True, drop_last=True, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, shuffle=False, **loader_kwargs)
+
     model = build_model(num_classes).to(device)
+    if device.type != "mps" and hasattr(torch, "compile"):
+        # Inductor fuses the conv+BN+activation chains; MPS support
+        # still has gaps, so it keeps eager mode.
+        try:
+            compiled = torch.compile(model, mode="reduce-overhead")
+            # Compile eagerly with a dummy batch so a broken inductor
+            # toolchain falls back here instead of failing mid-epoch.
+            compiled.eval()
+            with torch.no_grad():
+                compiled(torch.zeros(2, 3, 224, 224, device=device))
+            compiled.train()
+            model = compiled
+        except Exception as exc:  # noqa: BLE001
+            print(f"torch.compile unavailable, training eager: {exc}")
     criterion = nn.CrossEntropyLoss()
     optimizer = optim.AdamW(model.parameters(), lr=cfg.lr, weight_decay=cfg.weight_decay)
+    scaler = torch.cuda.amp.GradScaler(enabled=device.type == "cuda")
     scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=cfg.epochs)
 
     best_acc = 0.0
@@ -218,7 +366,7 @@ def main(cfg: Optional[TrainConfig] = None) -> None:
     with history_path.open("w", encoding="utf-8") as history_file:
         history_file.write("epoch,train_loss,train_acc,val_loss,val_acc,lr\n")
         for epoch in range(1, cfg.epochs + 1):
-            train_loss, train_acc = train_one_epoch(model, train_loader, criterion, optimizer, device)
+            train_loss, train_acc = train_one_epoch(model, train_loader, criterion, optimizer, scaler, device)
             val_loss, val_acc = evaluate(model, val_loader, criterion, device)
             scheduler.step()
 
@@ -233,8 +381,10 @@ def main(cfg: Optional[TrainConfig] = None) -> None:
 
             if val_acc > best_acc:
                 best_acc = val_acc
-                # Save only the model state_dict to avoid pickle issues
-                torch.save(model.state_dict(), best_path)
+                # Save only the model state_dict to avoid pickle issues.
+                # Unwrap torch.compile's OptimizedModule so the keys stay
+                # loadable by run_inference's plain mobilenet_v3_small.
+                torch.save(getattr(model, "_orig_mod", model).state_dict(), best_path)
                 print(f"✨ Saved new best model to {best_path} (val_acc={val_acc:.3f})")
 
     print("Training complete! Best validation accuracy:", round(best_acc, 3))
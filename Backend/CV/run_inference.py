@@ -4,18 +4,22 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import json
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple
 
 import cv2
 import numpy as np
 import torch
-from PIL import Image
 from torch import nn
-from torchvision import models, transforms
+from torchvision import models, ops
 
 CLASS_NAMES = {0: "free_parking_space", 1: "not_free_parking_space"}
+BATCH_CHUNK_SIZE = 64
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
 SCRIPT_DIR = Path(__file__).resolve().parent
 DEFAULT_CHECKPOINT = SCRIPT_DIR / "model" / "mobilenet_v3_small_best.pth"
 
@@ -31,6 +35,11 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument("--output", type=Path, default=Path("./slot_predictions.json"), help="Output JSON file path.")
     parser.add_argument("--margin", type=float, default=0.05, help="Extra padding ratio for each slot crop.")
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Dynamically quantize linear layers to int8 for CPU inference.",
+    )
     return parser.parse_args()
 
 
@@ -42,11 +51,14 @@ def resolve_device() -> torch.device:
     return torch.device("cpu")
 
 
-def load_model(checkpoint: Path, device: torch.device) -> nn.Module:
-    weights = models.MobileNet_V3_Small_Weights.IMAGENET1K_V1
-    model = models.mobilenet_v3_small(weights=weights)
-    in_features = model.classifier[-1].in_features
-    model.classifier[-1] = nn.Linear(in_features, len(CLASS_NAMES))
+@lru_cache(maxsize=4)
+def load_model(checkpoint: Path, device: torch.device, quantize: bool = False) -> nn.Module:
+    """Build and optimize the classifier; memoized so periodic callers
+    (scheduler.py) skip the checkpoint unpickle + device copy + warmup
+    on every run after the first."""
+    # The checkpoint overwrites every weight, so skip the ImageNet
+    # download/init and build the head at the right width directly.
+    model = models.mobilenet_v3_small(weights=None, num_classes=len(CLASS_NAMES))
     state = torch.load(checkpoint, map_location=device, weights_only=False)
     if isinstance(state, dict) and "model_state" in state:
         model.load_state_dict(state["model_state"])
@@ -54,55 +66,190 @@ def load_model(checkpoint: Path, device: torch.device) -> nn.Module:
         model.load_state_dict(state)
     model.eval()
     model.to(device)
-    return model
+    if device.type in ("cuda", "mps"):
+        # FP16 halves weight/activation bandwidth for the memory-bound
+        # MobileNet forward; both backends support it natively.
+        model = model.half()
+    if quantize and device.type == "cpu":
+        # int8 weights quarter the bandwidth the memory-bound CPU forward
+        # pass spends streaming FP32 weights.
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {nn.Linear}, dtype=torch.qint8
+        )
+    compiled = compile_model(model, device)
+    if compiled is not None:
+        return compiled
+    return script_model(model, checkpoint, device, quantized=quantize)
+
+
+def compile_model(model: nn.Module, device: torch.device):
+    """Try torch.compile in reduce-overhead mode; return None to fall back.
+
+    Inductor fuses MobileNet's many pointwise bn+activation ops and wires
+    up CUDA graphs automatically, replacing the hand-rolled capture in
+    build_forward. Compilation failures fall back to the TorchScript path.
+    """
+    if device.type not in ("cuda", "cpu") or not hasattr(torch, "compile"):
+        return None
+    try:
+        compiled = torch.compile(model, mode="reduce-overhead", fullgraph=True)
+        dtype = next(model.parameters()).dtype
+        with torch.no_grad():
+            # Pre-warm so the one-time compile cost is paid at load, not
+            # on the first frame.
+            compiled(
+                torch.randn(BATCH_CHUNK_SIZE, 3, 224, 224, device=device, dtype=dtype)
+            )
+        compiled._uses_cuda_graphs = device.type == "cuda"
+        return compiled
+    except Exception as exc:  # noqa: BLE001
+        print(f"torch.compile skipped: {exc}")
+        return None
+
+
+def script_model(
+    model: nn.Module, checkpoint: Path, device: torch.device, quantized: bool = False
+) -> nn.Module:
+    """Trace + freeze the model for inference, caching the scripted module.
+
+    The scripted module fuses Conv+BN+activation and inlines constants;
+    it is saved next to the checkpoint as ``.ts.pt`` and reused as long
+    as it is newer than the checkpoint. Falls back to the eager model if
+    scripting fails or the outputs drift.
+    """
+    scripted_path = checkpoint.with_suffix(".int8.ts.pt" if quantized else ".ts.pt")
+    try:
+        if (
+            scripted_path.exists()
+            and scripted_path.stat().st_mtime >= checkpoint.stat().st_mtime
+        ):
+            return torch.jit.load(str(scripted_path), map_location=device)
+
+        dtype = next(model.parameters()).dtype
+        example = torch.randn(1, 3, 224, 224, device=device, dtype=dtype)
+        with torch.no_grad():
+            scripted = torch.jit.freeze(torch.jit.trace(model, example))
+            if device.type == "cpu":
+                scripted = torch.utils.mobile_optimizer.optimize_for_mobile(scripted)
+            else:
+                scripted = torch.jit.optimize_for_inference(scripted)
+            # Parity check: keep the eager model if tracing changed the numbers.
+            # int8 logits legitimately drift more than an FP32 trace.
+            tol = 1e-1 if quantized else 1e-3
+            if not torch.allclose(model(example), scripted(example), atol=tol, rtol=tol):
+                return model
+        torch.jit.save(scripted, str(scripted_path))
+        return scripted
+    except Exception as exc:  # noqa: BLE001
+        print(f"TorchScript optimization skipped: {exc}")
+        return model
+
 
+@lru_cache(maxsize=4)
+def build_forward(model: nn.Module, device: torch.device):
+    """Return a callable that runs ``model`` on a [N,3,224,224] chunk.
 
-def crop_slot(
-    image: np.ndarray, rect: Tuple[float, float, float, float], margin_ratio: float
-) -> Image.Image:
-    x, y, width, height = rect
-    margin = margin_ratio * max(width, height)
+    On CUDA the forward pass is captured once as a CUDA Graph over a
+    fixed-shape static input buffer; each call then copies the (padded)
+    chunk into the buffer and replays the graph, skipping per-kernel
+    launch bookkeeping. Other devices fall back to calling the model
+    directly.
+    """
+    if device.type != "cuda" or getattr(model, "_uses_cuda_graphs", False):
+        # Either no CUDA, or torch.compile already manages CUDA graphs.
+        return model
+
+    with torch.no_grad():
+        static_in = torch.empty(
+            (BATCH_CHUNK_SIZE, 3, 224, 224), device=device, dtype=torch.float16
+        )
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                model(static_in)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_out = model(static_in)
+
+    def forward(chunk: torch.Tensor) -> torch.Tensor:
+        count = chunk.shape[0]
+        if count < BATCH_CHUNK_SIZE:
+            chunk = nn.functional.pad(
+                chunk, (0, 0, 0, 0, 0, 0, 0, BATCH_CHUNK_SIZE - count)
+            )
+        static_in.copy_(chunk)
+        graph.replay()
+        return static_out[:count]
+
+    return forward
 
-    x0 = max(int(round(x - margin)), 0)
-    y0 = max(int(round(y - margin)), 0)
-    x1 = min(int(round(x + width + margin)), image.shape[1])
-    y1 = min(int(round(y + height + margin)), image.shape[0])
 
-    if x1 <= x0:
-        x1 = min(x0 + 1, image.shape[1])
-    if y1 <= y0:
-        y1 = min(y0 + 1, image.shape[0])
+def compute_boxes(
+    rects: np.ndarray, margin_ratio: float, image_shape: Tuple[int, ...]
+) -> np.ndarray:
+    """Expand every rectangle by its margin and clamp to the image, vectorized."""
+    arr = rects.astype(np.float32, copy=False)
+    margins = margin_ratio * arr[:, 2:4].max(axis=1)
+    x0 = np.clip(arr[:, 0] - margins, 0, image_shape[1])
+    y0 = np.clip(arr[:, 1] - margins, 0, image_shape[0])
+    x1 = np.clip(arr[:, 0] + arr[:, 2] + margins, 0, image_shape[1])
+    y1 = np.clip(arr[:, 1] + arr[:, 3] + margins, 0, image_shape[0])
+    return np.stack([x0, y0, x1, y1], axis=1)
 
-    roi = image[y0:y1, x0:x1]
-    return Image.fromarray(cv2.cvtColor(roi, cv2.COLOR_BGR2RGB))
 
+def batch_slots(image: np.ndarray, boxes: np.ndarray, device: torch.device) -> torch.Tensor:
+    """Crop, resize, and normalize every slot on-device in one pass.
 
-def load_rectangles(json_path: Path) -> List[Tuple[float, float, float, float, int]]:
+    The BGR image is uploaded once; BGR->RGB is a channel permute, and
+    `roi_align` crops+resizes all N boxes in parallel instead of the
+    per-slot cvtColor/PIL-resize/ToTensor chain.
+    """
+    img_t = torch.from_numpy(image)
+    rois = torch.zeros((boxes.shape[0], 5), dtype=torch.float32)
+    rois[:, 1:] = torch.from_numpy(boxes)
+    if device.type == "cuda":
+        # Stage in pinned host memory so the uploads are true async DMA
+        # instead of synchronous pageable-memory copies.
+        img_t = img_t.pin_memory()
+        rois = rois.pin_memory()
+    img_t = img_t.to(device, non_blocking=True)
+    rois = rois.to(device, non_blocking=True)
+    img_t = img_t.permute(2, 0, 1)[[2, 1, 0]].float()
+    batch = ops.roi_align(img_t.unsqueeze(0), rois, output_size=(224, 224), aligned=True)
+    # Normalize in one fused sub/mul pass: the /255 scale is folded into
+    # the constants, so the full-resolution image is never divided and
+    # the per-crop divide becomes a multiply.
+    mean = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1) * 255.0
+    inv_std = 1.0 / (torch.tensor(IMAGENET_STD, device=device).view(1, 3, 1, 1) * 255.0)
+    return batch.sub_(mean).mul_(inv_std)
+
+
+def load_rectangles(json_path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """Parse rectangle regions into SoA arrays: [N,4] xywh and [N] region ids."""
     data = json.loads(json_path.read_text(encoding="utf-8"))
     iterable = data if isinstance(data, list) else data.values()
-    rects: List[Tuple[float, float, float, float, int]] = []
+    rows = []
+    ids = []
     for entry in iterable:
         for region in entry.get("regions", []):
             attrs = region.get("shape_attributes", {})
             if attrs.get("name") != "rect":
                 continue
-            x = float(attrs.get("x", 0))
-            y = float(attrs.get("y", 0))
-            width = float(attrs.get("width", 0))
-            height = float(attrs.get("height", 0))
-            rect_id = int(region.get("id", len(rects)))
-            rects.append((x, y, width, height, rect_id))
-    return rects
-
-
-def build_transform() -> transforms.Compose:
-    return transforms.Compose(
-        [
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ]
-    )
+            rows.append((
+                attrs.get("x", 0),
+                attrs.get("y", 0),
+                attrs.get("width", 0),
+                attrs.get("height", 0),
+            ))
+            # Ids stay out of the float array so string ids still parse
+            # and large ints keep exact precision; the fallback numbers
+            # by kept rects, not by position among all regions.
+            ids.append(int(region.get("id", len(ids))))
+    boxes = np.asarray(rows, dtype=np.float32).reshape(-1, 4)
+    return boxes, np.asarray(ids, dtype=np.int64)
 
 
 def run_inference(image_path=None, json_path=None, output_path=None, checkpoint_path=None) -> dict:
@@ -119,32 +266,54 @@ def run_inference(image_path=None, json_path=None, output_path=None, checkpoint_
                 self.output = Path(output_path) if output_path else Path("./slot_predictions.json")
                 self.checkpoint = Path(checkpoint_path) if checkpoint_path else DEFAULT_CHECKPOINT
                 self.margin = 0.05
+                self.quantize = False
         args = Args()
     else:
         # Otherwise use command line arguments
         args = parse_args()
     
     device = resolve_device()
-    transform = build_transform()
 
     image = cv2.imread(str(args.image))
     if image is None:
         raise FileNotFoundError(f"Failed to load image: {args.image}")
 
-    rectangles = load_rectangles(args.json)
-    model = load_model(args.checkpoint, device)
+    rects, region_ids = load_rectangles(args.json)
+    model = load_model(args.checkpoint, device, quantize=args.quantize)
+    forward = build_forward(model, device)
 
-    results = []
-    with torch.no_grad():
-        for idx, rect in enumerate(rectangles):
-            x, y, width, height, region_id = rect
-            patch = crop_slot(image, (x, y, width, height), args.margin)
-            tensor = transform(patch).unsqueeze(0).to(device)
-            logits = model(tensor)
-            pred = torch.argmax(logits, dim=1).item()
-            results.append({"id": region_id, "occupied": bool(pred == 1)})
-
-    payload = {"image": args.image.name, "slots": results}
+    ids: List[int] = []
+    occupied: List[bool] = []
+    with torch.set_grad_enabled(False):
+        if len(rects):
+            boxes = compute_boxes(rects, args.margin, image.shape)
+            batch = batch_slots(image, boxes, device)
+            if device.type in ("cuda", "mps"):
+                batch = batch.half()
+            # One forward per chunk instead of per slot: dispatch overhead is paid
+            # once and the device sees a real batch dimension. On CPU, bf16
+            # autocast halves bandwidth without converting the weights.
+            autocast_ctx = (
+                torch.autocast("cpu", dtype=torch.bfloat16)
+                if device.type == "cpu"
+                else contextlib.nullcontext()
+            )
+            preds: List[int] = []
+            with autocast_ctx:
+                for chunk in torch.split(batch, BATCH_CHUNK_SIZE):
+                    logits = forward(chunk)
+                    preds.extend(logits.argmax(dim=1).cpu().tolist())
+            # SoA results: parallel id/occupancy arrays instead of N dicts.
+            ids = region_ids.tolist()
+            occupied = (np.asarray(preds, dtype=np.int64) == 1).tolist()
+
+    payload = {
+        "image": args.image.name,
+        "ids": ids,
+        "occupied": occupied,
+        # Kept for API compatibility with existing consumers of slots.
+        "slots": [{"id": i, "occupied": o} for i, o in zip(ids, occupied)],
+    }
     
     # Save to file
     args.output.parent.mkdir(parents=True, exist_ok=True)
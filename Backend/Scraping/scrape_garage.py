@@ -3,108 +3,180 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from bs4 import BeautifulSoup
 from datetime import datetime
-import re
+import atexit
+import requests
 
-def scrape_garage():
-# Configure Chrome to run in headless mode (background)
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-images")
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get("https://osu.campusparc.com/")
-
-    # Wait for and click the "See All Garages" button
-    print("Looking for 'See All Garages' button...")
-    try:
-    # Try multiple possible selectors for the "See All Garages" button
-        selectors = [
-            "a.cpLink",  # Original selector you provided
-            "a[href='#']",  # Generic link with href="#"
-            "//a[contains(text(), 'See All Garages')]",  # XPath by text content
-            "//a[contains(@class, 'cpLink')]",  # XPath by class
-            ".cpLink",  # Class selector
-            "[role='button']"  # By role attribute
-        ]
-    
-        button_found = False
-    
-        for selector in selectors:
+CAMPUSPARC_URL = "https://osu.campusparc.com/"
+
+# Candidate selectors for the "See All Garages" button, tried once; the
+# first one that works is cached on the scraper for every later scrape.
+BUTTON_SELECTORS = [
+    "a.cpLink",  # Original selector
+    "a[href='#']",  # Generic link with href="#"
+    "//a[contains(text(), 'See All Garages')]",  # XPath by text content
+    "//a[contains(@class, 'cpLink')]",  # XPath by class
+    ".cpLink",  # Class selector
+    "[role='button']",  # By role attribute
+]
+
+
+class GarageScraper:
+    """Scrape CampusParc garage occupancy with one persistent Chrome session.
+
+    Browser cold-start (~5-15 s) is paid once in __init__; subsequent
+    scrape() calls just refresh the page and re-click the cached
+    "See All Garages" selector.
+    """
+
+    def __init__(self):
+        # Configure Chrome to run in headless mode (background)
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-images")
+        self.driver = webdriver.Chrome(options=chrome_options)
+        self._button_selector = None
+        self._button_by = None
+
+    def close(self):
+        self.driver.quit()
+
+    def _click_see_all(self):
+        if self._button_selector is not None:
+            # Selector already discovered; one wait, one click.
             try:
-                if selector.startswith("//"):  # XPath selector
-                    see_all_button = WebDriverWait(driver, 3).until(
-                        EC.element_to_be_clickable((By.XPATH, selector))
-                    )
-                else:  # CSS selector
-                    see_all_button = WebDriverWait(driver, 3).until(
-                        EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                    )
-            
-                print(f"Found button with selector: {selector}")
-                print("Clicking 'See All Garages' button...")
-                see_all_button.click()
-                button_found = True
-                break
-            
-            except:
+                button = WebDriverWait(self.driver, 5).until(
+                    EC.element_to_be_clickable((self._button_by, self._button_selector))
+                )
+                button.click()
+                return True
+            except Exception:
+                # Page layout may have changed; fall through to rediscovery.
+                self._button_selector = None
+                self._button_by = None
+
+        print("Looking for 'See All Garages' button...")
+        for selector in BUTTON_SELECTORS:
+            by = By.XPATH if selector.startswith("//") else By.CSS_SELECTOR
+            try:
+                button = WebDriverWait(self.driver, 3).until(
+                    EC.element_to_be_clickable((by, selector))
+                )
+            except Exception:
                 continue
-    
-        if button_found:
-            # Wait a moment for the content to load after clicking
-            import time
-            time.sleep(3)
-            print("Button clicked successfully, waiting for content to update...")
-        else:
-            print("Could not find 'See All Garages' button with any selector")
-    
-    except Exception as e:
-        print(f"Error while trying to click button: {e}")
-        print("Proceeding with whatever data is available...")
-
-     #wait until the garageData appears
-    print("Waiting for garage data to load...")
-    WebDriverWait(driver, 15).until(
-        EC.presence_of_element_located((By.CSS_SELECTOR, "div.garageData"))
-    )
-    soup = BeautifulSoup(driver.page_source, "lxml")
-    garage = soup.select_one("div.garageData")
-
-    garage_data = {}
-    time_stamp = garage.find('p', class_='lastUpdate')
-    timestamp_text = time_stamp.text.strip()
-    print(f"Raw timestamp: {timestamp_text}")
-    
-    # Parse timestamp from "Last Update: 10/25/2025 7:09 PM" format
+            print(f"Found button with selector: {selector}")
+            print("Clicking 'See All Garages' button...")
+            button.click()
+            self._button_selector = selector
+            self._button_by = by
+            return True
+
+        print("Could not find 'See All Garages' button with any selector")
+        return False
+
+    def scrape(self):
+        try:
+            if self.driver.current_url.startswith(CAMPUSPARC_URL):
+                self.driver.refresh()
+            else:
+                self.driver.get(CAMPUSPARC_URL)
+        except WebDriverException:
+            # Session died (browser crash / timeout); start a fresh page load.
+            self.driver.get(CAMPUSPARC_URL)
+
+        # The partial table may already be on the page before the click;
+        # keep a handle so we can wait for the click to replace it rather
+        # than parsing the pre-click data.
+        stale_ref = None
+        try:
+            stale_ref = self.driver.find_element(By.CSS_SELECTOR, "div.garageData")
+        except WebDriverException:
+            pass
+
+        clicked = self._click_see_all()
+
+        # Wait until the garageData appears instead of a fixed sleep.
+        print("Waiting for garage data to load...")
+        if clicked and stale_ref is not None:
+            try:
+                WebDriverWait(self.driver, 10).until(EC.staleness_of(stale_ref))
+            except TimeoutException:
+                # Some layouts update the table in place; the presence
+                # wait below still covers that case.
+                pass
+        WebDriverWait(self.driver, 15).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "div.garageData"))
+        )
+        return self._parse(self.driver.page_source)
+
+    @staticmethod
+    def _parse(page_source):
+        soup = BeautifulSoup(page_source, "lxml")
+        garage = soup.select_one("div.garageData")
+
+        garage_data = {}
+        time_stamp = garage.find('p', class_='lastUpdate')
+        timestamp_text = time_stamp.text.strip()
+        print(f"Raw timestamp: {timestamp_text}")
+
+        # Parse timestamp from "Last Update: 10/25/2025 7:09 PM" format
+        try:
+            # Extract the datetime part after "Last Update: "
+            datetime_str = timestamp_text.replace("Last Update: ", "")
+
+            # Parse the datetime string
+            parsed_datetime = datetime.strptime(datetime_str, "%m/%d/%Y %I:%M %p")
+
+            # Convert to ISO format for SQL database
+            sql_timestamp = parsed_datetime.isoformat()
+
+            print(f"Parsed datetime: {parsed_datetime}")
+            print(f"SQL timestamp: {sql_timestamp}")
+
+        except ValueError as e:
+            print(f"Error parsing timestamp: {e}")
+            # Fallback to current time if parsing fails
+            parsed_datetime = datetime.now()
+            sql_timestamp = parsed_datetime.isoformat()
+            print(f"Using current time as fallback: {sql_timestamp}")
+
+        for data in garage.find('tbody').findAll('tr'):
+            cols = data.findAll('td')
+            garage_name = cols[0].text.strip()
+            if not garage_name.startswith("Carmack") and not garage_name.startswith("Buckeye"):
+                garage_name += " Garage"
+            occupancy = int(cols[1].text.strip()[:len(cols[1].text.strip()) - 1])
+            garage_data[garage_name] = occupancy
+
+        return garage_data, sql_timestamp
+
+
+_scraper = None
+
+
+def scrape_garage():
+    """Scrape once, preferring a plain HTTP GET over the browser.
+
+    A single GET + lxml parse is orders of magnitude cheaper than a
+    headless Chromium session; Selenium (with its persistent driver) is
+    kept only as a fallback for when the table is not present in the
+    static HTML.
+    """
+    global _scraper
     try:
-        # Extract the datetime part after "Last Update: "
-        datetime_str = timestamp_text.replace("Last Update: ", "")
-        
-        # Parse the datetime string
-        parsed_datetime = datetime.strptime(datetime_str, "%m/%d/%Y %I:%M %p")
-        
-        # Convert to ISO format for SQL database
-        sql_timestamp = parsed_datetime.isoformat()
-        
-        print(f"Parsed datetime: {parsed_datetime}")
-        print(f"SQL timestamp: {sql_timestamp}")
-        
-    except ValueError as e:
-        print(f"Error parsing timestamp: {e}")
-        # Fallback to current time if parsing fails
-        parsed_datetime = datetime.now()
-        sql_timestamp = parsed_datetime.isoformat()
-        print(f"Using current time as fallback: {sql_timestamp}")
-
-    for data in garage.find('tbody').findAll('tr'):
-        cols = data.findAll('td')
-        garage_name = cols[0].text.strip()
-        if not garage_name.startswith("Carmack") and not garage_name.startswith("Buckeye"):
-            garage_name += " Garage"
-        occupancy = int(cols[1].text.strip()[:len(cols[1].text.strip()) - 1])
-        garage_data[garage_name] = occupancy
-    driver.quit()
-
-    return garage_data, sql_timestamp
\ No newline at end of file
+        response = requests.get(CAMPUSPARC_URL, timeout=10)
+        response.raise_for_status()
+        if "garageData" in response.text:
+            return GarageScraper._parse(response.text)
+        print("garageData not in static HTML; falling back to Selenium")
+    except Exception as e:
+        print(f"HTTP scrape failed ({e}); falling back to Selenium")
+    if _scraper is None:
+        _scraper = GarageScraper()
+        # Make sure headless Chrome doesn't outlive the process.
+        atexit.register(_scraper.close)
+    return _scraper.scrape()
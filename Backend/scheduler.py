@@ -35,23 +35,26 @@ try:
         print(inference_results)
         try:
             parking_name = 'Stadium Northeast Parking'
-            occupied_count = 0
-            # Access the 'slots' key from the JSON result
-            slots = inference_results.get('slots', [])
-            
-            for result in slots:
-                data = {
-                    "spot_id": int(result['id']),
+            # SoA arrays from run_inference: parallel ids/occupancy lists
+            spot_ids = inference_results.get('ids', [])
+            occupied = inference_results.get('occupied', [])
+
+            # One upsert for the whole lot instead of one round-trip per spot
+            rows = [
+                {
+                    "spot_id": int(spot_id),
                     "lot_name": parking_name,
-                    "is_filled": int(result['occupied']),
+                    "is_filled": int(is_filled),
                 }
-                if result['occupied']:
-                    occupied_count += 1
-                response = supabase.table("parking_spot").upsert(data).execute()
-                if len(response.data) > 0:
-                    print(f"✅ Updated spot {data['spot_id']}: {'occupied' if data['is_filled'] else 'free'}")
+                for spot_id, is_filled in zip(spot_ids, occupied)
+            ]
+            occupied_count = sum(occupied)
+            if rows:
+                response = supabase.table("parking_spot").upsert(rows).execute()
+                if len(response.data) == len(rows):
+                    print(f"✅ Updated {len(rows)} spots in one upsert")
                 else:
-                    print(f"⚠️  Warning: Could not update spot {data['spot_id']}")
+                    print(f"⚠️  Warning: upserted {len(response.data)}/{len(rows)} spots")
 
             lot_data = {
                 "lot_name": parking_name,
@@ -87,21 +90,23 @@ print(f"Data last updated: {last_updated}")
 capacity = supabase.table("parking_lot").select("lot_name, capacity").execute().data
 capacity_dict = {item['lot_name']: item['capacity'] for item in capacity}
 
+# Batch all garage rows into a single upsert keyed on lot_name
+updates = []
 for garage_name, occupancy in garage_data.items():
-    data = {
-        "occupancy": round(occupancy/100 * capacity_dict.get(garage_name, 0)),
+    if garage_name not in capacity_dict:
+        print(f"⚠️  Warning: {garage_name} not found in database")
+        continue
+    updates.append({
+        "lot_name": garage_name,
+        "occupancy": round(occupancy/100 * capacity_dict[garage_name]),
         "last_updated": last_updated  # Add timestamp to database
-    }
-    
+    })
+
+if updates:
     try:
-        response = supabase.table("parking_lot").update(data).eq("lot_name", garage_name).execute()
-      
-        if len(response.data) > 0:
-            print(f"✅ Updated {garage_name}: {data['occupancy']}")
-        else:
-            print(f"⚠️  Warning: {garage_name} not found in database")
-            
+        response = supabase.table("parking_lot").upsert(updates, on_conflict="lot_name").execute()
+        print(f"✅ Updated {len(response.data)} garages in one upsert")
     except Exception as e:
-        print(f"❌ Error updating {garage_name}: {e}")
+        print(f"❌ Error updating garages: {e}")
 
 print("Database update completed!")
\ No newline at end of file
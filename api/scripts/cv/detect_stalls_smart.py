@@ -19,7 +19,8 @@ from __future__ import annotations
 
 import argparse
 import json
-import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Tuple
@@ -27,6 +28,15 @@ from typing import List, Tuple
 import cv2
 import numpy as np
 
+try:  # Optional: faster parse when the existing stalls.json is large.
+  import orjson
+except ImportError:
+  orjson = None
+
+# Separable Gaussian coefficients computed once per process instead of
+# on every GaussianBlur call.
+GAUSS_K3 = cv2.getGaussianKernel(3, 0)
+
 
 @dataclass
 class Aisle:
@@ -42,6 +52,10 @@ def parse_args() -> argparse.Namespace:
   parser.add_argument("--image", required=True)
   parser.add_argument("--json-output", required=True)
   parser.add_argument("--lot-id", required=True)
+  parser.add_argument(
+      "--lot-output",
+      help="Write {lot_id: stalls} to this path instead of merging into "
+      "--json-output; keeps per-lot updates O(1) as the combined file grows")
   parser.add_argument("--preview")
   parser.add_argument("--horizontal-cluster-gap", type=float, default=14.0)
   parser.add_argument("--vertical-cluster-gap", type=float, default=18.0)
@@ -50,11 +64,14 @@ def parse_args() -> argparse.Namespace:
 
 
 def load_image(path: Path):
-  img = cv2.imread(str(path))
+  # Decode from the raw bytes: imdecode reuses the file buffer directly
+  # instead of imread's extra path handling and staging allocation.
+  raw = np.frombuffer(path.read_bytes(), dtype=np.uint8)
+  img = cv2.imdecode(raw, cv2.IMREAD_COLOR)
   if img is None:
     raise ValueError(f"Failed to read image {path}")
   gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-  blur = cv2.GaussianBlur(gray, (3, 3), 0)
+  blur = cv2.sepFilter2D(gray, -1, GAUSS_K3, GAUSS_K3)
   edges = cv2.Canny(blur, 40, 110, apertureSize=3, L2gradient=True)
   return img, edges
 
@@ -62,24 +79,61 @@ def load_image(path: Path):
 def cluster_positions(values: List[float], gap: float) -> List[float]:
   if not values:
     return []
-  values.sort()
-  clusters = []
-  current = [values[0]]
-  for v in values[1:]:
-    if v - current[-1] <= gap:
-      current.append(v)
-    else:
-      clusters.append(sum(current) / len(current))
-      current = [v]
-  clusters.append(sum(current) / len(current))
-  return clusters
-
-
-def detect_aisles(edges: np.ndarray,
-                  orientation: str,
-                  cluster_gap: float,
-                  min_length: float = 150.0) -> List[Aisle]:
-  lines = cv2.HoughLinesP(
+  # Sort once, split wherever consecutive values jump by more than gap,
+  # and average each bucket — all C loops instead of per-element Python.
+  ordered = np.sort(np.asarray(values, dtype=np.float64))
+  splits = np.flatnonzero(np.diff(ordered) > gap) + 1
+  return [float(group.mean()) for group in np.split(ordered, splits)]
+
+
+def smooth_projection(projection: np.ndarray, radius: int = 5) -> np.ndarray:
+  """Smooth a 1-D projection with three cumsum box blurs.
+
+  A triple box blur approximates a Gaussian (sigma ~= radius) to within a
+  few percent at a fraction of the cost, and skips OpenCV's 2-D filter
+  machinery on a degenerate 1xN input.
+  """
+  smoothed = projection.astype(np.float32, copy=False)
+  radius = max(1, min(radius, smoothed.size - 1))
+  window = 2 * radius + 1
+  for _ in range(3):
+    padded = np.concatenate(
+        (smoothed[radius:0:-1], smoothed, smoothed[-2:-radius - 2:-1]))
+    csum = np.concatenate(([0.0], np.cumsum(padded, dtype=np.float64)))
+    smoothed = ((csum[window:] - csum[:-window]) / window).astype(np.float32)
+  return smoothed
+
+
+# CUDA Hough detector, created once per process; False marks the CUDA
+# path as unusable so later calls skip straight to CPU.
+_cuda_hough = None
+
+
+def detect_line_segments(edges: np.ndarray):
+  """Run probabilistic Hough on CUDA when a device exists, else on CPU.
+
+  Hough voting is the compute-bound stage on large lot imagery; the CUDA
+  segment detector is an order of magnitude faster there. Output is
+  reshaped to HoughLinesP's (N, 1, 4) layout so callers are agnostic.
+  """
+  global _cuda_hough
+  if (_cuda_hough is not False and hasattr(cv2, "cuda")
+      and cv2.cuda.getCudaEnabledDeviceCount() > 0):
+    # AttributeError covers CUDA builds without the contrib cudaimgproc
+    # module, where createHoughSegmentDetector does not exist.
+    try:
+      if _cuda_hough is None:
+        _cuda_hough = cv2.cuda.createHoughSegmentDetector(
+            1.0, np.pi / 180, 120, 25)
+      gpu_edges = cv2.cuda_GpuMat()
+      gpu_edges.upload(edges)
+      lines = _cuda_hough.detect(gpu_edges).download()
+      if lines is None:
+        return None
+      return lines.reshape(-1, 1, 4)
+    except (cv2.error, AttributeError):
+      _cuda_hough = False  # fall back to the CPU path below
+  return cv2.HoughLinesP(
       edges,
       rho=1,
       theta=np.pi / 180,
@@ -87,56 +141,61 @@ def detect_aisles(edges: np.ndarray,
       minLineLength=120,
       maxLineGap=25)
 
+
+def detect_aisles(edges: np.ndarray,
+                  orientation: str,
+                  cluster_gap: float,
+                  min_length: float = 150.0) -> List[Aisle]:
+  lines = detect_line_segments(edges)
+
   if lines is None:
     return []
 
-  filtered = []
-  for x1, y1, x2, y2 in lines[:, 0]:
-    dx, dy = x2 - x1, y2 - y1
-    length = math.hypot(dx, dy)
-    if length < min_length:
-      continue
-    angle = math.degrees(math.atan2(dy, dx))
-    if orientation == "horizontal":
-      if abs(angle) < 12 or abs(abs(angle) - 180) < 12:
-        filtered.append((x1, y1, x2, y2, length))
-    else:
-      if abs(abs(angle) - 90) < 12:
-        filtered.append((x1, y1, x2, y2, length))
+  # Length/angle filtering over the whole Hough batch at once instead of
+  # per-segment math calls in a Python loop.
+  segs = lines[:, 0].astype(np.float32)
+  dx = segs[:, 2] - segs[:, 0]
+  dy = segs[:, 3] - segs[:, 1]
+  length = np.hypot(dx, dy)
+  angle = np.degrees(np.arctan2(dy, dx))
+  if orientation == "horizontal":
+    angle_ok = (np.abs(angle) < 12) | (np.abs(np.abs(angle) - 180) < 12)
+  else:
+    angle_ok = np.abs(np.abs(angle) - 90) < 12
+  segs = segs[(length >= min_length) & angle_ok]
 
-  if not filtered:
+  if len(segs) == 0:
     return []
 
   # cluster based on orthogonal coordinate (y for horizontal, x for vertical)
-  coords = [((y1 + y2) / 2) if orientation == "horizontal" else ((x1 + x2) / 2)
-            for x1, y1, x2, y2, _ in filtered]
-  clusters = cluster_positions(coords, cluster_gap)
+  if orientation == "horizontal":
+    refs = (segs[:, 1] + segs[:, 3]) * 0.5
+    span_lo = np.minimum(segs[:, 0], segs[:, 2])
+    span_hi = np.maximum(segs[:, 0], segs[:, 2])
+    thicknesses = np.abs(segs[:, 3] - segs[:, 1])
+  else:
+    refs = (segs[:, 0] + segs[:, 2]) * 0.5
+    span_lo = np.minimum(segs[:, 1], segs[:, 3])
+    span_hi = np.maximum(segs[:, 1], segs[:, 3])
+    thicknesses = np.abs(segs[:, 2] - segs[:, 0])
+
+  clusters = cluster_positions(refs.tolist(), cluster_gap)
 
   aisles: List[Aisle] = []
   for center in clusters:
-    span_start = float("inf")
-    span_end = float("-inf")
-    thickness_accum = []
-    for x1, y1, x2, y2, _ in filtered:
-      reference = (y1 + y2) / 2 if orientation == "horizontal" else (x1 + x2) / 2
-      if abs(reference - center) <= cluster_gap:
-        if orientation == "horizontal":
-          span_start = min(span_start, x1, x2)
-          span_end = max(span_end, x1, x2)
-          thickness_accum.append(abs(y2 - y1))
-        else:
-          span_start = min(span_start, y1, y2)
-          span_end = max(span_end, y1, y2)
-          thickness_accum.append(abs(x2 - x1))
+    member = np.abs(refs - center) <= cluster_gap
+    if not member.any():
+      continue
+    span_start = float(span_lo[member].min())
+    span_end = float(span_hi[member].max())
     if span_end <= span_start:
       continue
-    thickness = np.median(thickness_accum) if thickness_accum else 10.0
     aisles.append(
         Aisle(orientation=orientation,
               start=span_start,
               end=span_end,
               fixed=center,
-              thickness=thickness))
+              thickness=float(np.median(thicknesses[member]))))
   return aisles
 
 
@@ -151,25 +210,21 @@ def slice_horizontal_aisle(edges: np.ndarray,
   if roi.size == 0:
     return []
 
-  projection = cv2.reduce(roi, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32F).ravel()
-  projection = cv2.GaussianBlur(projection, (1, 31), 0).ravel()
+  # int32 accumulator can't overflow on uint8 Canny output, and the NumPy
+  # reduction skips cv2.reduce's call overhead on these small ROIs.
+  projection = roi.sum(axis=0, dtype=np.int32).astype(np.float32)
+  projection = smooth_projection(projection)
   if projection.max() == 0:
     return []
 
   norm = projection / projection.max()
   mask = norm > stripe_threshold
-  segments = []
-  in_seg = False
-  seg_start = 0
-  for idx, flag in enumerate(mask):
-    if flag and not in_seg:
-      in_seg = True
-      seg_start = idx
-    elif not flag and in_seg:
-      in_seg = False
-      segments.append((seg_start, idx))
-  if in_seg:
-    segments.append((seg_start, len(mask)))
+  # Detect True runs with one diff pass instead of iterating every
+  # projection sample in Python: +1 marks a run start, -1 a run end.
+  delta = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+  starts = np.flatnonzero(delta == 1)
+  ends = np.flatnonzero(delta == -1)
+  segments = list(zip(starts.tolist(), ends.tolist()))
 
   if len(segments) < 2:
     return []
@@ -202,25 +257,18 @@ def slice_vertical_aisle(edges: np.ndarray,
   if roi.size == 0:
     return []
 
-  projection = cv2.reduce(roi, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32F).ravel()
-  projection = cv2.GaussianBlur(projection, (31, 1), 0).ravel()
+  projection = roi.sum(axis=1, dtype=np.int32).astype(np.float32)
+  projection = smooth_projection(projection)
   if projection.max() == 0:
     return []
 
   norm = projection / projection.max()
   mask = norm > stripe_threshold
-  segments = []
-  in_seg = False
-  seg_start = 0
-  for idx, flag in enumerate(mask):
-    if flag and not in_seg:
-      in_seg = True
-      seg_start = idx
-    elif not flag and in_seg:
-      in_seg = False
-      segments.append((seg_start, idx))
-  if in_seg:
-    segments.append((seg_start, len(mask)))
+  # Same diff-based run detection as the horizontal slicer.
+  delta = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+  starts = np.flatnonzero(delta == 1)
+  ends = np.flatnonzero(delta == -1)
+  segments = list(zip(starts.tolist(), ends.tolist()))
 
   if len(segments) < 2:
     return []
@@ -244,32 +292,40 @@ def slice_vertical_aisle(edges: np.ndarray,
 
 def boxes_to_stalls(boxes: List[Tuple[int, int, int, int]],
                     start_index: int) -> Tuple[List[dict], int]:
-  stalls = []
-  idx = start_index
-  for x0, y0, x1, y1 in boxes:
-    polygon = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
-    stalls.append({
-        "id": f"S-{idx:03d}",
-        "polygon": polygon,
-        "permit": ["C"],
-        "status": "open",
-        "confidence": 0.7
-    })
-    idx += 1
-  return stalls, idx
+  if not boxes:
+    return [], start_index
+  # Expand every box to its four corners in one C-level pass instead of
+  # building a small list-of-lists per box.
+  arr = np.asarray(boxes, dtype=np.int32)
+  corners = np.stack(
+      (arr[:, [0, 1]], arr[:, [2, 1]], arr[:, [2, 3]], arr[:, [0, 3]]),
+      axis=1)
+  stalls = [{
+      "id": f"S-{start_index + offset:03d}",
+      "polygon": polygon,
+      "permit": ["C"],
+      "status": "open",
+      "confidence": 0.7
+  } for offset, polygon in enumerate(corners.tolist())]
+  return stalls, start_index + len(stalls)
 
 
 def save_preview(image: np.ndarray, stalls: List[dict], path: Path):
   preview = image.copy()
-  for stall in stalls:
-    pts = np.array(stall["polygon"], np.int32)
-    cv2.fillPoly(preview, [pts], (60, 200, 80))
-    cv2.polylines(preview, [pts], True, (0, 0, 0), 1)
+  # Batch all polygons into single fillPoly/polylines calls instead of a
+  # Python->C trip per stall.
+  all_pts = [np.asarray(stall["polygon"], np.int32) for stall in stalls]
+  if all_pts:
+    cv2.fillPoly(preview, all_pts, (60, 200, 80))
+    cv2.polylines(preview, all_pts, True, (0, 0, 0), 1)
   path.parent.mkdir(parents=True, exist_ok=True)
   cv2.imwrite(str(path), preview)
 
 
 def main():
+  # OpenCV's internal thread pool anti-scales on the small ROIs this
+  # script processes; single-threaded is consistently faster.
+  cv2.setNumThreads(1)
   args = parse_args()
   image_path = Path(args.image)
   json_path = Path(args.json_output)
@@ -281,31 +337,47 @@ def main():
   vertical_aisles = detect_aisles(
       edges, "vertical", args.vertical_cluster_gap, min_length=80)
 
+  # Each aisle slices a disjoint ROI and the cv2/NumPy reductions release
+  # the GIL, so the per-aisle work fans out across a thread pool. IDs are
+  # assigned after gathering so the output order stays deterministic.
+  with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+    horizontal_boxes = list(executor.map(
+        lambda aisle: slice_horizontal_aisle(edges, aisle, args.stripe_threshold),
+        horizontal_aisles))
+    vertical_boxes = list(executor.map(
+        lambda aisle: slice_vertical_aisle(edges, aisle, args.stripe_threshold),
+        vertical_aisles))
+
   stalls: List[dict] = []
   next_id = 1
-
-  for aisle in horizontal_aisles:
-    boxes = slice_horizontal_aisle(edges, aisle, args.stripe_threshold)
+  for boxes in horizontal_boxes + vertical_boxes:
     new_stalls, next_id = boxes_to_stalls(boxes, next_id)
     stalls.extend(new_stalls)
 
-  for aisle in vertical_aisles:
-    boxes = slice_vertical_aisle(edges, aisle, args.stripe_threshold)
-    new_stalls, next_id = boxes_to_stalls(boxes, next_id)
-    stalls.extend(new_stalls)
-
-  stalls.sort(key=lambda s: (np.mean([p[1] for p in s["polygon"]]),
-                             np.mean([p[0] for p in s["polygon"]])))
-
-  if json_path.exists():
-    with open(json_path) as f:
-      data = json.load(f)
+  # Sum is monotonic in the mean for fixed-size polygons, and the builtin
+  # skips np.mean's array construction/dispatch on every 4-point list.
+  stalls.sort(key=lambda s: (sum(p[1] for p in s["polygon"]),
+                             sum(p[0] for p in s["polygon"])))
+
+  if args.lot_output:
+    # Per-lot file: constant-time write with an atomic swap, no
+    # round-trip of every other lot through the parser.
+    lot_path = Path(args.lot_output)
+    lot_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = lot_path.with_suffix(lot_path.suffix + ".tmp")
+    with open(tmp_path, "w") as f:
+      json.dump({args.lot_id: stalls}, f, indent=2)
+    os.replace(tmp_path, lot_path)
   else:
-    data = {}
-  data[args.lot_id] = stalls
+    if json_path.exists():
+      raw = json_path.read_bytes()
+      data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    else:
+      data = {}
+    data[args.lot_id] = stalls
 
-  with open(json_path, "w") as f:
-    json.dump(data, f, indent=2)
+    with open(json_path, "w") as f:
+      json.dump(data, f, indent=2)
 
   if args.preview:
     save_preview(image, stalls, Path(args.preview))
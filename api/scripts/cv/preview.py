@@ -36,18 +36,30 @@ def main():
   stalls_path = Path(args.stalls)
   out_path = Path(args.out)
 
-  img = cv2.imread(str(image_path))
+  raw = np.frombuffer(image_path.read_bytes(), dtype=np.uint8)
+  img = cv2.imdecode(raw, cv2.IMREAD_COLOR)
   if img is None:
     raise ValueError(f"Cannot open image {image_path}")
 
   data: Dict[str, Any] = json.loads(stalls_path.read_text())
   stalls: List[Dict[str, Any]] = data.get(args.lot_id, [])
 
+  # Group polygons by color so the whole overlay renders in three batched
+  # draw calls instead of two per stall.
+  open_pts: List[np.ndarray] = []
+  closed_pts: List[np.ndarray] = []
   for stall in stalls:
-    pts = np.array(stall["polygon"], np.int32)
-    color = (0, 200, 0) if stall.get("status", "open") == "open" else (0, 0, 200)
-    cv2.fillPoly(img, [pts], color)
-    cv2.polylines(img, [pts], True, (0, 0, 0), 1)
+    pts = np.asarray(stall["polygon"], np.int32)
+    if stall.get("status", "open") == "open":
+      open_pts.append(pts)
+    else:
+      closed_pts.append(pts)
+  if open_pts:
+    cv2.fillPoly(img, open_pts, (0, 200, 0))
+  if closed_pts:
+    cv2.fillPoly(img, closed_pts, (0, 0, 200))
+  if open_pts or closed_pts:
+    cv2.polylines(img, open_pts + closed_pts, True, (0, 0, 0), 1)
 
   out_path.parent.mkdir(parents=True, exist_ok=True)
   cv2.imwrite(str(out_path), img)
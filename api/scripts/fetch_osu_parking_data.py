@@ -8,7 +8,14 @@ import json
 from pathlib import Path
 from typing import Any, Dict, Iterable, List
 
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter, Retry
+
+try:  # Optional: 2-5x faster parse of MB-scale Overpass payloads.
+    import orjson
+except ImportError:
+    orjson = None
 
 OVERPASS_ENDPOINTS = [
     "https://overpass-api.de/api/interpreter",
@@ -16,6 +23,20 @@ OVERPASS_ENDPOINTS = [
     "https://z.overpass-api.de/api/interpreter"
 ]
 
+# One session for both queries: reuses the TCP+TLS connection and retries
+# transient Overpass errors with backoff before falling to the next mirror.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset({"POST"}),
+    ),
+))
+
 
 def build_query(bbox: str, amenity: str) -> str:
     return f"""
@@ -33,8 +54,10 @@ def request_overpass(query: str) -> Dict[str, Any]:
     last_error: Exception | None = None
     for url in OVERPASS_ENDPOINTS:
         try:
-            response = requests.post(url, data=query, timeout=60)
+            response = SESSION.post(url, data=query, timeout=60)
             response.raise_for_status()
+            if orjson is not None:
+                return orjson.loads(response.content)
             return response.json()
         except Exception as exc:  # noqa: BLE001
             last_error = exc
@@ -60,12 +83,18 @@ def element_to_feature(element: Dict[str, Any]) -> Dict[str, Any]:
             "coordinates": [element["lon"], element["lat"]]
         }
     elif geometry:
-        coords = [[g["lon"], g["lat"]] for g in geometry]
-        if coords and coords[0] != coords[-1]:
-            coords.append(coords[0])
+        # Pull lon/lat pairs into one ndarray and close the ring with a
+        # vstack; a single C pass instead of per-point list building.
+        coords = np.fromiter(
+            (value for point in geometry for value in (point["lon"], point["lat"])),
+            dtype=np.float64,
+            count=2 * len(geometry),
+        ).reshape(-1, 2)
+        if not np.array_equal(coords[0], coords[-1]):
+            coords = np.vstack((coords, coords[:1]))
         feature["geometry"] = {
             "type": "Polygon",
-            "coordinates": [coords]
+            "coordinates": [coords.tolist()]
         }
     else:
         center = element.get("center")
@@ -82,6 +111,16 @@ def features_from_overpass(elements: Iterable[Dict[str, Any]]) -> List[Dict[str,
     return [element_to_feature(el) for el in elements]
 
 
+def write_geojson(path: Path, collection: Dict[str, Any]) -> None:
+    # orjson emits the indented bytes in one pass; json.dumps builds the
+    # whole pretty-printed str before writing.
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(
+            collection, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
+    else:
+        path.write_text(json.dumps(collection, indent=2) + "\n")
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Fetch OSU parking data from OSM")
     parser.add_argument("--south", type=float, default=40.0000)
@@ -113,17 +152,17 @@ def main() -> int:
     lots_out = args.dir / args.lots
     spaces_out = args.dir / args.spaces
 
-    lots_out.write_text(json.dumps({
+    write_geojson(lots_out, {
         "type": "FeatureCollection",
         "features": lot_features,
         "bbox": [args.west, args.south, args.east, args.north]
-    }, indent=2) + "\n")
+    })
 
-    spaces_out.write_text(json.dumps({
+    write_geojson(spaces_out, {
         "type": "FeatureCollection",
         "features": space_features,
         "bbox": [args.west, args.south, args.east, args.north]
-    }, indent=2) + "\n")
+    })
 
     print(f"Saved lots to {lots_out}")
     print(f"Saved spaces to {spaces_out}")